@@ -0,0 +1,188 @@
+"""
+A local cache of decompressed MRT files. Re-ingesting a file that is already
+in the cache skips both the download and the bz2 decompression, and cached
+files are read through mmap so memory use does not grow with the file size.
+
+Routeview filenames are the same on every collector, so entries are addressed
+by a SHA-1 of the full URL or path of the source file instead. For local
+files, such as those in a mirror, the size and modification time of the file
+are included too, so a file that is re-synced or corrected gets a new entry.
+The total size of the cache is capped, evicting the least recently used files
+first.
+"""
+
+import bz2
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import time
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+# Suffix given to decompressed files stored in the cache
+CACHE_SUFFIX = '.mrt'
+
+# Suffix given to files that are still being decompressed, and the age after
+# which they are assumed to have been left behind by a killed process.
+TEMP_SUFFIX = '.tmp'
+TEMP_MAX_AGE = 60 * 60
+
+class MappedFile:
+    """ A read-only file-like object over a memory-mapped file, suitable for
+    passing to mrtparse's Reader. Each read is a slice of the map, so only the
+    record being decoded is held in memory rather than the whole file.
+
+    :param path: The path to the file to map.
+    """
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.size = os.fstat(self.f.fileno()).st_size
+        # mmap cannot map an empty file
+        if self.size:
+            self.map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = None
+        self.pos = 0
+
+    def read(self, n=-1):
+        """ Read up to n bytes from the current position. Reads past the end
+        of the file return fewer bytes, or an empty string at the end.
+        """
+        if self.map is None:
+            return b''
+        if n < 0:
+            end = self.size
+        else:
+            end = min(self.pos + n, self.size)
+        # mrtparse concatenates the header and payload buffers and decodes
+        # strings from them, which a memoryview does not support, so this
+        # returns a copy of the record rather than a view.
+        data = self.map[self.pos:end]
+        self.pos = end
+        return data
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.f.close()
+
+class MRTCache:
+    """ A size-capped directory of decompressed MRT files.
+
+    :param root: The directory to store cached files in. Created if it does
+    not exist.
+    :param max_bytes: The maximum total size of the cached files.
+    """
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def path(self, source):
+        """ Gets the path that a file would be cached at.
+
+        :param source: The URL or local path of the original MRT file.
+        """
+        key = source
+        if os.path.isfile(source):
+            st = os.stat(source)
+            key = '%s %d %d' % (os.path.abspath(source), st.st_size,
+                                int(st.st_mtime))
+        if isinstance(key, type(u'')):
+            key = key.encode('utf-8')
+        digest = hashlib.sha1(key).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + CACHE_SUFFIX)
+
+    def contains(self, source):
+        """ Whether a decompressed copy of source is in the cache.
+        """
+        return os.path.isfile(self.path(source))
+
+    def open(self, source, filename=None):
+        """ Opens the cached copy of source, decompressing it into the cache
+        first if it is not already present.
+
+        :param source: The URL or local path of the original MRT file.
+        :param filename: The path to a local copy of source (e.g. one that was
+        just downloaded) to decompress. Defaults to source itself.
+        :return: A MappedFile over the decompressed data.
+        """
+        cached = self.path(source)
+        if os.path.isfile(cached):
+            # Touching the file records it as recently used
+            os.utime(cached, None)
+        else:
+            self.put(source, filename)
+        return MappedFile(cached)
+
+    def put(self, source, filename=None):
+        """ Decompresses the local file filename (or source, if filename is not
+        given) into the cache as the entry for source, then evicts the least
+        recently used entries if the cache is over its size limit.
+        """
+        cached = self.path(source)
+        if filename is None:
+            filename = source
+        subdir = os.path.dirname(cached)
+        if not os.path.isdir(subdir):
+            os.makedirs(subdir)
+
+        # Write to a temporary file first so an interrupted decompression
+        # never leaves a truncated entry in the cache.
+        fd, tmp = tempfile.mkstemp(suffix=TEMP_SUFFIX, dir=subdir)
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                with open(filename, 'rb') as f:
+                    compressed = f.read(3) == b'BZh'
+                if compressed:
+                    src = bz2.BZ2File(filename, 'rb')
+                else:
+                    src = open(filename, 'rb')
+                try:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                finally:
+                    src.close()
+            os.rename(tmp, cached)
+        except:
+            os.remove(tmp)
+            raise
+
+        self.evict(keep=cached)
+        return cached
+
+    def evict(self, keep=None):
+        """ Removes the least recently used files until the total size of the
+        cache is within max_bytes. Temporary files older than TEMP_MAX_AGE are
+        removed too.
+
+        :param keep: The path of an entry that must not be removed, such as
+        one that is about to be read.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if name.endswith(TEMP_SUFFIX):
+                    if os.stat(path).st_mtime < now - TEMP_MAX_AGE:
+                        os.remove(path)
+                    continue
+                if not name.endswith(CACHE_SUFFIX):
+                    continue
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
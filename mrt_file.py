@@ -25,6 +25,9 @@ class SeqGenerator:
     def get_seq(self, prefix, ts):
         """ Gets the sequence number for an update message. Calling this method
         will change its result on subsequent calls.
+
+        :param prefix: The prefix in text form. This is the same object as the
+        one in the line, so the key costs no extra memory.
         """
         entry = self.dict.get(prefix)
         
@@ -51,11 +54,15 @@ class MRTExtractor:
     
     :param input: An object with a 'read' attribute or str containing the path
     to the MRT file.
+    :param cache: An optional mrt_cache.MRTCache. If given and input is a path,
+    the file is read from (and if necessary decompressed into) the cache.
     """
-    def __init__(self, input):
+    def __init__(self, input, cache=None):
         global seq, snapshot
         # Following is required by Reader class
         assert hasattr(input, 'read') or isinstance(input, str)
+        if cache and isinstance(input, str):
+            input = cache.open(input)
         self.reader = Reader(input)
         
         # Sequence and snapshot must be reset for each file
@@ -260,7 +267,8 @@ class MRTParser:
             return ' '.join(self.as_path)
 
 # These subclasses will extract specific data fields from the MRTExtractor and
-# return them in a tuple.
+# return them in a tuple. Each prefix is formatted once, when it is parsed,
+# and the same string is shared by every line for it.
 
 class RIBExtractor(MRTParser):
     """ Represents a RIB file.
@@ -0,0 +1,289 @@
+"""
+Reconstructs the routing state seen by the routeview collector at an arbitrary
+time, by loading the midnight RIB snapshot for that day into a prefix table and
+replaying updates on top of it. The state can then be queried from memory
+with longest-prefix-match lookups or per-peer AS paths.
+
+Rows have the same layout as the ones produced by mrt_file's RIBExtractor and
+UpdatesExtractor. MirrorRows reads them from a local mirror of the archive.
+"""
+
+import arrow
+import calendar
+import os
+import socket
+from collections import OrderedDict
+
+import mrt_file
+from rv_catalogue import RVCatalogue
+
+# Maximum number of reconstructed states kept in memory by RIBHistory
+DEFAULT_MAX_STATES = 4
+
+def parse_addr(addr):
+    """ Converts an IPv4 or IPv6 address in text form into a tuple of
+    (address family, packed address) where the packed address is the bytes
+    returned by inet_pton.
+    """
+    af = socket.AF_INET6 if ':' in addr else socket.AF_INET
+    return af, socket.inet_pton(af, addr)
+
+def parse_prefix(prefix):
+    """ Converts a prefix in text form ('addr/len') into a tuple of
+    (address family, packed network, length). Any bits of the address beyond
+    the length are cleared.
+    """
+    addr, plen = prefix.split('/')
+    af, packed = parse_addr(addr)
+    plen = int(plen)
+    return af, mask(packed, plen), plen
+
+def mask(packed, plen):
+    """ Clears the bits of a packed address beyond the first plen.
+    """
+    octets = bytearray(packed)
+    n, bits = divmod(plen, 8)
+    if bits:
+        octets[n] &= (0xff << (8 - bits)) & 0xff
+        n += 1
+    for i in range(n, len(octets)):
+        octets[i] = 0
+    return bytes(octets)
+
+def to_ms(tm):
+    """ Converts an arrow (or datetime) UTC time into milliseconds since the
+    epoch, the unit used for timestamps in the tables.
+    """
+    return calendar.timegm(tm.utctimetuple()) * 1000
+
+class PrefixTable:
+    """ The prefixes of one address family, stored as one dict per prefix
+    length keyed by the packed network address. Each value is a dict of
+    {peer IP: (peer AS, AS path)}. A longest-prefix-match probes the lengths
+    present, longest first, so a lookup costs at most one dict access per
+    distinct length rather than one node per bit.
+    """
+    def __init__(self):
+        self.lengths = {}
+        self.count = 0
+
+    def announce(self, network, plen, peer_ip, peer_as, as_path):
+        prefixes = self.lengths.get(plen)
+        if prefixes is None:
+            prefixes = self.lengths[plen] = {}
+        routes = prefixes.get(network)
+        if routes is None:
+            routes = prefixes[network] = {}
+        if peer_ip not in routes:
+            self.count += 1
+        routes[peer_ip] = (peer_as, as_path)
+
+    def withdraw(self, network, plen, peer_ip):
+        prefixes = self.lengths.get(plen)
+        if prefixes is None:
+            return
+        routes = prefixes.get(network)
+        if routes is None or peer_ip not in routes:
+            return
+        del routes[peer_ip]
+        self.count -= 1
+        if not routes:
+            del prefixes[network]
+            if not prefixes:
+                del self.lengths[plen]
+
+    def routes(self, network, plen):
+        """ Gets the routes for the prefix with exactly this network and
+        length.
+        """
+        return self.lengths.get(plen, {}).get(network, {})
+
+    def longest_match(self, packed, peer_ip=None):
+        """ Gets a tuple of (network, prefix length, routes) for the longest
+        prefix containing the packed address, or None if there is no such
+        prefix. If peer_ip is given only prefixes that peer has a route for
+        are considered.
+        """
+        for plen in sorted(self.lengths, reverse=True):
+            network = mask(packed, plen)
+            routes = self.lengths[plen].get(network)
+            if routes and (peer_ip is None or peer_ip in routes):
+                return network, plen, routes
+        return None
+
+class RIBState:
+    """ The routing state at a point in time, built by loading a RIB snapshot
+    and then replaying updates in order.
+
+    :param ts: The time in milliseconds that the state is for, which is
+    advanced as updates are replayed.
+    """
+    def __init__(self, ts):
+        self.ts = ts
+        self.tables = {
+            socket.AF_INET: PrefixTable(),
+            socket.AF_INET6: PrefixTable(),
+        }
+
+    def __len__(self):
+        return sum(table.count for table in self.tables.values())
+
+    def load_rib(self, rows):
+        """ Loads rows of RIB data, as produced by RIBExtractor.get_line().
+        """
+        for prefix, peer_as, peer_ip, snapshot, ts, as_path in rows:
+            af, network, plen = parse_prefix(prefix)
+            self.tables[af].announce(network, plen, peer_ip, peer_as, as_path)
+
+    def replay(self, rows, until):
+        """ Applies rows of Updates data, as produced by
+        UpdatesExtractor.get_line(), that were recorded after the current time
+        of the state and at or before until (in milliseconds). Rows are applied
+        as they are read, so they must be in order of timestamp and sequence
+        number, as they are in an updates file.
+        """
+        for prefix, ts, seq, peer_as, peer_ip, flag, as_path in rows:
+            if ts <= self.ts or ts > until:
+                continue
+            af, network, plen = parse_prefix(prefix)
+            if flag == 'A':
+                self.tables[af].announce(network, plen, peer_ip, peer_as,
+                                         as_path)
+            elif flag == 'W':
+                self.tables[af].withdraw(network, plen, peer_ip)
+        self.ts = until
+
+    def lookup(self, addr, peer_ip=None):
+        """ Finds the longest prefix matching an address.
+
+        :param addr: An IPv4 or IPv6 address in text form.
+        :param peer_ip: If given, only routes from this peer are considered.
+        :return: A tuple of (prefix, {peer IP: (peer AS, AS path)}), or None if
+        no prefix matches. If peer_ip was given only its route is included.
+        """
+        af, packed = parse_addr(addr)
+        match = self.tables[af].longest_match(packed, peer_ip)
+        if match is None:
+            return None
+        network, plen, routes = match
+        if peer_ip is not None:
+            routes = {peer_ip: routes[peer_ip]}
+        else:
+            routes = dict(routes)
+        return ('%s/%d' % (socket.inet_ntop(af, network), plen), routes)
+
+    def paths(self, prefix):
+        """ Gets the routes for an exact prefix.
+
+        :return: A dict of {peer IP: (peer AS, AS path)}.
+        """
+        af, network, plen = parse_prefix(prefix)
+        return dict(self.tables[af].routes(network, plen))
+
+    def path(self, prefix, peer_ip):
+        """ Gets the AS path a peer had for an exact prefix, or None if the
+        peer had no route for it.
+        """
+        route = self.paths(prefix).get(peer_ip)
+        return route[1] if route else None
+
+class RIBHistory:
+    """ Reconstructs the routing state at arbitrary times. The most recently
+    used states are cached, and a query later on the same day as a cached
+    state only replays the updates between the two times.
+
+    :param rib_rows: A function taking the midnight (UTC) of a day as an arrow
+    time and returning the RIB rows of the snapshot taken then.
+    :param update_rows: A function taking a start and end time in
+    milliseconds and returning the Updates rows recorded in between, in order
+    (see RIBState.replay()). Rows outside of this range are ignored.
+    :param max_states: The number of reconstructed states to keep.
+    """
+    def __init__(self, rib_rows, update_rows, max_states=DEFAULT_MAX_STATES):
+        self.rib_rows = rib_rows
+        self.update_rows = update_rows
+        self.max_states = max_states
+        # Keyed by the time of the snapshot each state was built from, with
+        # the most recently used last.
+        self.states = OrderedDict()
+
+    def _state_at(self, tm):
+        """ Gets the routing state at a UTC time, as a RIBState. The state is
+        cached and advanced by later queries, so it is not handed out.
+        """
+        day = tm.replace(hour=0, minute=0, second=0, microsecond=0)
+        key = to_ms(day)
+        until = to_ms(tm)
+
+        state = self.states.pop(key, None)
+        if state is None or state.ts > until:
+            # Updates cannot be undone, so an earlier time is rebuilt from the
+            # snapshot.
+            state = RIBState(key)
+            state.load_rib(self.rib_rows(day))
+        if state.ts < until:
+            state.replay(self.update_rows(state.ts, until), until)
+
+        self.states[key] = state
+        while len(self.states) > self.max_states:
+            self.states.popitem(last=False)
+        return state
+
+    def lookup(self, tm, addr, peer_ip=None):
+        """ Finds the longest prefix matching an address at a UTC time. See
+        RIBState.lookup().
+        """
+        return self._state_at(tm).lookup(addr, peer_ip)
+
+    def paths(self, tm, prefix):
+        """ Gets the routes for a prefix at a UTC time. See RIBState.paths().
+        """
+        return self._state_at(tm).paths(prefix)
+
+    def path(self, tm, prefix, peer_ip):
+        """ Gets the AS path a peer had for a prefix at a UTC time. See
+        RIBState.path().
+        """
+        return self._state_at(tm).path(prefix, peer_ip)
+
+class MirrorRows:
+    """ Reads RIB and Updates rows for RIBHistory from the MRT files in a
+    local mirror of the archive. The mirror is indexed once, when this is
+    created, so files added to it afterwards are not seen.
+
+    :param root: The path to the local mirror.
+    :param cache: An optional mrt_cache.MRTCache to read the files through.
+    """
+    def __init__(self, root, cache=None):
+        assert RVCatalogue.isLocal(root)
+        self.cache = cache
+        # Lists of (time, path) tuples sorted by time
+        self.ribs = []
+        self.updates = []
+        for tm, path in RVCatalogue.indexLocalData(root):
+            name = os.path.basename(path)
+            if name.startswith('rib'):
+                self.ribs.append((tm, path))
+            elif name.startswith('updates'):
+                self.updates.append((tm, path))
+
+    def rib_rows(self, day):
+        i = RVCatalogue.firstIndexAfter(self.ribs, day)
+        if i == len(self.ribs) or self.ribs[i][0] != day:
+            raise IOError('No RIB snapshot in the mirror for %s' % day)
+        return mrt_file.MRTExtractor(self.ribs[i][1], self.cache).lines('RIB')
+
+    def update_rows(self, start, end):
+        # Each updates file is named after the start of the period it covers,
+        # so the file containing start may be named before it.
+        first = arrow.get(start // 1000)
+        first = first.replace(minute=first.minute - first.minute % 15,
+                              second=0, microsecond=0)
+        i = RVCatalogue.firstIndexAfter(self.updates, first)
+        while i < len(self.updates) and to_ms(self.updates[i][0]) <= end:
+            # Rows are generated one file at a time, since MRTExtractor
+            # resets the sequence numbers for each file.
+            extractor = mrt_file.MRTExtractor(self.updates[i][1], self.cache)
+            for row in extractor.lines('Updates'):
+                yield row
+            i += 1
@@ -7,10 +7,17 @@ Author: Marianne Fletcher
 """
 
 import arrow
+import bisect
 import pytz
 import re
 from online_dir import OnlineDir
 
+try:
+    from os import scandir
+except ImportError:
+    # Python 2 requires the scandir backport
+    from scandir import scandir
+
 baseUrl = 'http://archive.routeviews.org/route-views6/bgpdata/'
 
 # Grouped into (year, month)
@@ -51,13 +58,75 @@ class RVCatalogue:
             tm = arrow.get(year, month, day, hour, minute)
             return tm
 
+    @staticmethod
+    def isLocal(dir):
+        """ Whether dir refers to a local mirror of the archive rather than
+        the routeview website.
+        """
+        return not re.match(r'[a-z]+://', dir, re.I)
+
+    @staticmethod
+    def indexLocalData(root, tm=None):
+        """ Walks a local mirror of the archive laid out like the website
+        (YYYY.MM/{RIBS,UPDATES}/) and returns a list of (time, path) tuples
+        sorted by time. If tm is given, month directories before the month of
+        tm are skipped. Symbolic links to directories are not followed, so a
+        link cycle in the mirror cannot make the walk loop.
+
+        tm - Must be UTC
+        """
+        index = []
+        if tm:
+            start = tm.replace(day=1, hour=0, minute=0, second=0,
+                               microsecond=0)
+        else:
+            start = None
+        stack = [root]
+        while stack:
+            for entry in scandir(stack.pop()):
+                if entry.is_dir(follow_symlinks=False):
+                    month = RVCatalogue.getMonth(entry.name + '/')
+                    if (month == None) or (start == None) or (month >= start):
+                        stack.append(entry.path)
+                else:
+                    filetime = RVCatalogue.getUTCTime(entry.name)
+                    if filetime:
+                        index.append((filetime, entry.path))
+        index.sort()
+        return index
+
+    @staticmethod
+    def firstIndexAfter(index, tm):
+        """ Finds the position in an index from indexLocalData() of the first
+        file recorded at or after tm, or the length of the index if there is
+        none.
+        """
+        # Paths sort after the empty string, so this is placed before any file
+        # recorded at tm.
+        return bisect.bisect_left(index, (tm, ''))
+
+    @staticmethod
+    def listLocalDataAfter(root, tm):
+        """ Finds the paths of files in a local mirror which the filenames
+        indicate were created at or after tm, oldest first.
+
+        tm - Must be UTC
+        """
+        index = RVCatalogue.indexLocalData(root, tm)
+        first = RVCatalogue.firstIndexAfter(index, tm)
+        return [path for filetime, path in index[first:]]
+
     @staticmethod
     def listDataAfter(dir, tm):
         """ Finds files which the filenames indicate were created at or after
-        tm. Recurses through subdirectories.
+        tm. Recurses through subdirectories. dir may be the URL of the archive
+        or the path to a local mirror of it, in which case the paths of the
+        files are listed in order of time.
         
         tm - Must be UTC
         """
+        if RVCatalogue.isLocal(dir):
+            return RVCatalogue.listLocalDataAfter(dir, tm)
         list = []
         dir = OnlineDir(dir)
         subdirs = dir.listSubdirs()
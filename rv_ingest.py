@@ -2,6 +2,7 @@
 
 from rv_catalogue import RVCatalogue
 from cass_interface import CassInterface
+from mrt_cache import MRTCache, DEFAULT_MAX_BYTES
 import mrt_file
 import os
 import sys
@@ -11,7 +12,17 @@ import pycurl
 RIB_META_NAME = 'importedrib'
 UPDATES_META_NAME = 'imported'
 
+# The archive to ingest from. This may also be the path to a local mirror of
+# the archive (e.g. one populated by rsync), which is read in place.
+ARCHIVE = 'http://archive.routeviews.org/route-views6/bgpdata/'
+
+# Directory to keep decompressed MRT files in so that re-ingesting them skips
+# the download and decompression. Set to None to disable the cache.
+CACHE_DIR = None
+CACHE_MAX_BYTES = DEFAULT_MAX_BYTES
+
 db = CassInterface()
+cache = MRTCache(CACHE_DIR, CACHE_MAX_BYTES) if CACHE_DIR else None
 
 try:
     # Where logging messages will be written
@@ -51,8 +62,10 @@ def fetch_file(url, tofile):
             errno, errstr = error
             logoutput.write(errstr)
 
+mirrored = RVCatalogue.isLocal(ARCHIVE)
+
 for remotefile in RVCatalogue.listDataAfter(
-    'http://archive.routeviews.org/route-views6/bgpdata/',
+    ARCHIVE,
     arrow.get(2018, 9, 25, 0, 0)):
     
     # Work out filename
@@ -74,8 +87,16 @@ for remotefile in RVCatalogue.listDataAfter(
         continue
     
     if not db.is_file_ingested(localfile, RIB_META_NAME if type == 'RIB' else UPDATES_META_NAME):
-        # File may already be here
-        if not os.path.isfile(localfile):
+        # Files in a local mirror are read where they are
+        path = remotefile if mirrored else localfile
+        
+        # File may already be here, or decompressed in the cache
+        cached = cache and cache.contains(remotefile)
+        if mirrored and not os.path.isfile(path):
+            # Removed from the mirror since it was listed, e.g. by rsync
+            logoutput.write('ERROR: File missing from mirror: %s\n' % (path))
+            continue
+        elif not cached and not os.path.isfile(path):
             # Do the actual fetching of the file
             logoutput.write('Fetching remote file: %s\n' % (remotefile))
             response = fetch_file(remotefile, localfile)
@@ -93,7 +114,12 @@ for remotefile in RVCatalogue.listDataAfter(
         logoutput.write('Ingesting file: %s\n' % (localfile))
         
         # Parse into lines and insert them into db
-        mrtfile = mrt_file.MRTExtractor(localfile)
+        if cache:
+            # Cached under the remote file, so that a later run can skip the
+            # download.
+            mrtfile = mrt_file.MRTExtractor(cache.open(remotefile, path))
+        else:
+            mrtfile = mrt_file.MRTExtractor(path)
         count = 0
         for line in mrtfile.lines(type):
             count += 1
@@ -109,7 +135,8 @@ for remotefile in RVCatalogue.listDataAfter(
 
         logoutput.write('Completed ingesting file: %s\n' % localfile)
         db.set_file_ingested(localfile, True, RIB_META_NAME if type == 'RIB' else UPDATES_META_NAME)
-        os.remove(localfile)    # Clean up
+        if not mirrored and os.path.isfile(localfile):
+            os.remove(localfile)    # Clean up
         
 if not logoutput == stdout:
     logoutput.close()
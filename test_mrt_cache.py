@@ -0,0 +1,127 @@
+""" Tests for mrt_cache. Run with pytest.
+"""
+
+import bz2
+import os
+import time
+
+from mrt_cache import MappedFile, MRTCache, TEMP_SUFFIX, TEMP_MAX_AGE
+
+def write(path, data, compress=False):
+    with open(str(path), 'wb') as f:
+        f.write(bz2.compress(data) if compress else data)
+    return str(path)
+
+def read_all(cache, source, filename=None):
+    f = cache.open(source, filename)
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def test_mapped_file_reads(tmpdir):
+    f = MappedFile(write(tmpdir.join('data'), b'0123456789'))
+    assert f.read(4) == b'0123'
+    assert f.read(4) == b'4567'
+    # Reads past the end are short, then empty
+    assert f.read(4) == b'89'
+    assert f.read(4) == b''
+    f.close()
+
+    f = MappedFile(write(tmpdir.join('data'), b'0123456789'))
+    f.read(2)
+    assert f.read() == b'23456789'
+    f.close()
+
+def test_mapped_file_empty(tmpdir):
+    f = MappedFile(write(tmpdir.join('empty'), b''))
+    assert f.read(12) == b''
+    f.close()
+
+def test_open_decompresses(tmpdir):
+    cache = MRTCache(str(tmpdir.join('cache')))
+    bz = write(tmpdir.join('rib.20180925.0000.bz2'), b'compressed', True)
+    raw = write(tmpdir.join('rib.20180925.0200'), b'raw')
+    assert not cache.contains(bz)
+    assert read_all(cache, bz) == b'compressed'
+    assert cache.contains(bz)
+    assert read_all(cache, raw) == b'raw'
+
+def test_same_name_on_different_collectors(tmpdir):
+    cache = MRTCache(str(tmpdir.join('cache')))
+    tmpdir.mkdir('a')
+    tmpdir.mkdir('b')
+    a = write(tmpdir.join('a', 'rib.20180925.0000.bz2'), b'a', True)
+    b = write(tmpdir.join('b', 'rib.20180925.0000.bz2'), b'b', True)
+    assert cache.path(a) != cache.path(b)
+    assert read_all(cache, a) == b'a'
+    assert read_all(cache, b) == b'b'
+
+def test_changed_file_gets_new_entry(tmpdir):
+    cache = MRTCache(str(tmpdir.join('cache')))
+    path = write(tmpdir.join('rib.20180925.0000.bz2'), b'old', True)
+    assert read_all(cache, path) == b'old'
+    write(path, b'newer', True)
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert not cache.contains(path)
+    assert read_all(cache, path) == b'newer'
+
+def test_url_source(tmpdir):
+    cache = MRTCache(str(tmpdir.join('cache')))
+    url = 'http://archive.routeviews.org/bgpdata/rib.20180925.0000.bz2'
+    local = write(tmpdir.join('rib.20180925.0000.bz2'), b'fetched', True)
+    assert not cache.contains(url)
+    assert read_all(cache, url, local) == b'fetched'
+    assert cache.contains(url)
+    assert cache.contains(u'' + url)
+    # Served from the cache once the download is gone
+    os.remove(local)
+    assert read_all(cache, url) == b'fetched'
+
+def test_evicts_least_recently_used(tmpdir):
+    cache = MRTCache(str(tmpdir.join('cache')), max_bytes=25)
+    paths = [write(tmpdir.join('f%d' % i), b'x' * 10) for i in range(3)]
+    for i, path in enumerate(paths[:2]):
+        cache.put(path)
+        # Distinct times, oldest first
+        then = time.time() - 100 + i
+        os.utime(cache.path(path), (then, then))
+    # Using the oldest entry makes the other one least recently used
+    read_all(cache, paths[0])
+    cache.put(paths[2])
+    assert cache.contains(paths[0])
+    assert not cache.contains(paths[1])
+    assert cache.contains(paths[2])
+
+def test_evict_keeps_new_entry(tmpdir):
+    cache = MRTCache(str(tmpdir.join('cache')), max_bytes=5)
+    path = write(tmpdir.join('big'), b'x' * 10)
+    # Larger than the cache on its own, but about to be read
+    assert read_all(cache, path) == b'x' * 10
+    assert cache.contains(path)
+
+def test_evict_removes_stale_temp_files(tmpdir):
+    root = tmpdir.mkdir('cache')
+    cache = MRTCache(str(root))
+    stale = write(root.join('stale' + TEMP_SUFFIX), b'partial')
+    then = time.time() - TEMP_MAX_AGE - 10
+    os.utime(stale, (then, then))
+    fresh = write(root.join('fresh' + TEMP_SUFFIX), b'partial')
+    cache.evict()
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+
+def test_failed_put_leaves_nothing(tmpdir):
+    root = tmpdir.join('cache')
+    cache = MRTCache(str(root))
+    # Not valid bz2 data after the magic
+    path = write(tmpdir.join('broken.bz2'), b'BZh9 not really bz2')
+    try:
+        cache.put(path)
+    except Exception:
+        pass
+    else:
+        assert False, 'put() should fail'
+    files = [f for d, ds, fs in os.walk(str(root)) for f in fs]
+    assert files == []
+    assert not cache.contains(path)
@@ -0,0 +1,213 @@
+""" Tests for rib_state. Run with pytest.
+"""
+
+import os
+
+import arrow
+import pytest
+
+import rib_state
+from rib_state import RIBState, RIBHistory, MirrorRows, to_ms
+
+DAY = arrow.get(2018, 9, 25)
+MIDNIGHT = to_ms(DAY)
+
+def rib(prefix, peer_ip, peer_as, as_path):
+    return (prefix, peer_as, peer_ip, MIDNIGHT, MIDNIGHT, as_path)
+
+def update(prefix, seconds, seq, peer_ip, peer_as, flag, as_path=''):
+    return (prefix, MIDNIGHT + seconds * 1000, seq, peer_as, peer_ip, flag,
+            as_path)
+
+RIB = [
+    rib('0.0.0.0/0', '192.0.2.1', 1, '1'),
+    rib('10.0.0.0/8', '192.0.2.1', 1, '1 10'),
+    rib('10.1.0.0/16', '192.0.2.2', 2, '2 10'),
+    rib('10.1.2.0/23', '192.0.2.1', 1, '1 3 10'),
+    rib('10.1.2.3/32', '192.0.2.2', 2, '2 4'),
+    rib('2001:db8::/32', '2001:db8::1', 3, '3'),
+    rib('2001:db8:1::/48', '2001:db8::1', 3, '3 5'),
+    rib('2001:db8:1::1/128', '2001:db8::2', 4, '4 6'),
+]
+
+UPDATES = [
+    update('10.1.0.0/16', 10, 0, '192.0.2.1', 1, 'A', '1 7 10'),
+    update('10.1.0.0/16', 20, 0, '192.0.2.2', 2, 'W'),
+    update('10.1.0.0/16', 20, 1, '192.0.2.2', 2, 'A', '2 8 10'),
+    update('10.1.2.3/32', 30, 0, '192.0.2.2', 2, 'W'),
+    update('2001:db8:1::/48', 40, 0, '2001:db8::1', 3, 'W'),
+]
+
+def loaded():
+    state = RIBState(MIDNIGHT)
+    state.load_rib(RIB)
+    return state
+
+def test_longest_match():
+    state = loaded()
+    assert len(state) == len(RIB)
+    assert state.lookup('10.1.2.3')[0] == '10.1.2.3/32'
+    assert state.lookup('10.1.3.255')[0] == '10.1.2.0/23'
+    assert state.lookup('10.1.4.1')[0] == '10.1.0.0/16'
+    assert state.lookup('10.200.0.1')[0] == '10.0.0.0/8'
+    assert state.lookup('11.0.0.1') == ('0.0.0.0/0', {'192.0.2.1': (1, '1')})
+    assert state.lookup('2001:db8:1::1')[0] == '2001:db8:1::1/128'
+    assert state.lookup('2001:db8:1::2')[0] == '2001:db8:1::/48'
+    assert state.lookup('2001:db8:ffff::1')[0] == '2001:db8::/32'
+    assert state.lookup('2001:db9::1') is None
+
+def test_longest_match_for_peer():
+    state = loaded()
+    assert state.lookup('10.1.2.3', '192.0.2.1') == \
+        ('10.1.2.0/23', {'192.0.2.1': (1, '1 3 10')})
+    assert state.lookup('11.0.0.1', '192.0.2.2') is None
+
+def test_host_bits_are_masked():
+    state = RIBState(MIDNIGHT)
+    state.load_rib([rib('10.1.2.3/22', '192.0.2.1', 1, '1')])
+    assert state.lookup('10.1.0.1')[0] == '10.1.0.0/22'
+    assert state.path('10.1.1.0/22', '192.0.2.1') == '1'
+
+def test_paths():
+    state = loaded()
+    assert state.paths('10.1.0.0/16') == {'192.0.2.2': (2, '2 10')}
+    assert state.path('10.1.0.0/16', '192.0.2.2') == '2 10'
+    assert state.path('10.1.0.0/16', '192.0.2.1') is None
+    assert state.paths('10.1.0.0/17') == {}
+
+def test_replay_in_order():
+    state = loaded()
+    state.replay(UPDATES, MIDNIGHT + 30 * 1000)
+    assert state.paths('10.1.0.0/16') == {
+        '192.0.2.1': (1, '1 7 10'),
+        '192.0.2.2': (2, '2 8 10'),
+    }
+    assert state.lookup('10.1.2.3')[0] == '10.1.2.0/23'
+    # Not yet withdrawn at the end of the replay
+    assert state.lookup('2001:db8:1::2')[0] == '2001:db8:1::/48'
+    assert state.ts == MIDNIGHT + 30 * 1000
+
+def test_replay_skips_rows_outside_range():
+    state = loaded()
+    state.replay(UPDATES, MIDNIGHT + 15 * 1000)
+    state.replay(UPDATES, MIDNIGHT + 15 * 1000)
+    assert len(state) == len(RIB) + 1
+    assert state.path('10.1.0.0/16', '192.0.2.2') == '2 10'
+
+def test_withdraw_unknown_route():
+    state = loaded()
+    state.replay([update('10.9.0.0/16', 1, 0, '192.0.2.1', 1, 'W'),
+                  update('10.1.0.0/16', 1, 0, '192.0.2.9', 9, 'W')],
+                 MIDNIGHT + 1000)
+    assert len(state) == len(RIB)
+
+class Rows:
+    """ Row functions for RIBHistory that record how they were called.
+    """
+    def __init__(self):
+        self.rib_calls = []
+        self.update_calls = []
+
+    def rib_rows(self, day):
+        self.rib_calls.append(day)
+        return list(RIB)
+
+    def update_rows(self, start, end):
+        self.update_calls.append((start, end))
+        return iter(UPDATES)
+
+def at(seconds, day=DAY):
+    return day.replace(second=seconds)
+
+def test_history_replays_incrementally():
+    rows = Rows()
+    history = RIBHistory(rows.rib_rows, rows.update_rows)
+    assert history.path(at(15), '10.1.0.0/16', '192.0.2.1') == '1 7 10'
+    assert history.path(at(25), '10.1.0.0/16', '192.0.2.2') == '2 8 10'
+    assert history.lookup(at(35), '10.1.2.3')[0] == '10.1.2.0/23'
+    assert rows.rib_calls == [DAY]
+    assert rows.update_calls == [
+        (MIDNIGHT, MIDNIGHT + 15000),
+        (MIDNIGHT + 15000, MIDNIGHT + 25000),
+        (MIDNIGHT + 25000, MIDNIGHT + 35000),
+    ]
+
+def test_history_rebuilds_for_earlier_time():
+    rows = Rows()
+    history = RIBHistory(rows.rib_rows, rows.update_rows)
+    assert history.lookup(at(35), '10.1.2.3')[0] == '10.1.2.0/23'
+    assert history.lookup(at(25), '10.1.2.3')[0] == '10.1.2.3/32'
+    assert len(rows.rib_calls) == 2
+    assert rows.update_calls[-1] == (MIDNIGHT, MIDNIGHT + 25000)
+
+def test_history_results_are_not_changed_by_later_queries():
+    rows = Rows()
+    history = RIBHistory(rows.rib_rows, rows.update_rows)
+    routes = history.paths(at(15), '10.1.0.0/16')
+    history.paths(at(25), '10.1.0.0/16')
+    assert routes == {'192.0.2.1': (1, '1 7 10'), '192.0.2.2': (2, '2 10')}
+
+def test_history_evicts_least_recently_used_day():
+    rows = Rows()
+    history = RIBHistory(rows.rib_rows, rows.update_rows, max_states=2)
+    days = [DAY.replace(day=d) for d in (25, 26, 27)]
+    history.lookup(days[0], '10.0.0.1')
+    history.lookup(days[1], '10.0.0.1')
+    history.lookup(days[0], '10.0.0.1')
+    history.lookup(days[2], '10.0.0.1')
+    # The 26th was least recently used, so only it has to be rebuilt
+    history.lookup(days[0], '10.0.0.1')
+    history.lookup(days[1], '10.0.0.1')
+    assert rows.rib_calls == [days[0], days[1], days[2], days[1]]
+
+MIRROR = [
+    '2018.09/RIBS/rib.20180925.0000.bz2',
+    '2018.09/RIBS/rib.20180925.0200.bz2',
+    '2018.09/UPDATES/updates.20180924.2345.bz2',
+    '2018.09/UPDATES/updates.20180925.0000.bz2',
+    '2018.09/UPDATES/updates.20180925.0015.bz2',
+    '2018.09/UPDATES/updates.20180925.0030.bz2',
+]
+
+@pytest.fixture
+def mirror(tmpdir, monkeypatch):
+    """ A mirror of empty files. Reading one yields a single row naming it.
+    """
+    for name in MIRROR:
+        tmpdir.join(*name.split('/')).ensure()
+    opened = []
+
+    class Extractor:
+        def __init__(self, path, cache=None):
+            self.name = os.path.basename(path)
+            opened.append(self.name)
+
+        def lines(self, type):
+            yield (self.name, type)
+
+    monkeypatch.setattr(rib_state.mrt_file, 'MRTExtractor', Extractor)
+    return MirrorRows(str(tmpdir)), opened
+
+def test_mirror_rib_rows(mirror):
+    rows, opened = mirror
+    assert list(rows.rib_rows(DAY)) == [('rib.20180925.0000.bz2', 'RIB')]
+
+def test_mirror_missing_rib(mirror):
+    rows, opened = mirror
+    with pytest.raises(IOError):
+        rows.rib_rows(DAY.replace(day=26))
+
+def test_mirror_update_rows(mirror):
+    rows, opened = mirror
+    # Starts in the file for 00:15, which is named before the start time
+    start = to_ms(DAY.replace(minute=20, second=30))
+    end = to_ms(DAY.replace(minute=30))
+    names = [name for name, type in rows.update_rows(start, end)]
+    assert names == ['updates.20180925.0015.bz2', 'updates.20180925.0030.bz2']
+
+def test_mirror_update_rows_are_streamed(mirror):
+    rows, opened = mirror
+    generated = rows.update_rows(MIDNIGHT, MIDNIGHT + 60 * 60 * 1000)
+    assert opened == []
+    next(generated)
+    assert opened == ['updates.20180925.0000.bz2']
@@ -0,0 +1,56 @@
+""" Tests for the local mirror support in rv_catalogue. Run with pytest.
+"""
+
+import os
+
+import arrow
+
+from rv_catalogue import RVCatalogue
+
+FILES = [
+    '2018.08/RIBS/rib.20180831.2200.bz2',
+    '2018.09/RIBS/rib.20180925.0000.bz2',
+    '2018.09/UPDATES/updates.20180924.2345.bz2',
+    '2018.09/UPDATES/updates.20180925.0000.bz2',
+]
+
+def make_mirror(tmpdir):
+    for name in FILES:
+        path = tmpdir.join(*name.split('/'))
+        path.ensure()
+    return str(tmpdir)
+
+def names(paths):
+    return [os.path.basename(path) for path in paths]
+
+def test_is_local():
+    assert RVCatalogue.isLocal('/srv/mirror/bgpdata')
+    assert not RVCatalogue.isLocal('http://archive.routeviews.org/bgpdata/')
+
+def test_index_is_sorted_by_time(tmpdir):
+    index = RVCatalogue.indexLocalData(make_mirror(tmpdir))
+    assert names(path for tm, path in index) == [
+        'rib.20180831.2200.bz2',
+        'updates.20180924.2345.bz2',
+        'rib.20180925.0000.bz2',
+        'updates.20180925.0000.bz2',
+    ]
+
+def test_list_data_after(tmpdir):
+    root = make_mirror(tmpdir)
+    paths = RVCatalogue.listDataAfter(root, arrow.get(2018, 9, 25, 0, 0))
+    assert names(paths) == ['rib.20180925.0000.bz2',
+                            'updates.20180925.0000.bz2']
+
+def test_month_not_pruned_for_time_with_seconds(tmpdir):
+    root = make_mirror(tmpdir)
+    tm = arrow.get(2018, 9, 1, 0, 0, 30)
+    index = RVCatalogue.indexLocalData(root, tm)
+    assert 'rib.20180925.0000.bz2' in names(path for t, path in index)
+    assert 'rib.20180831.2200.bz2' not in names(path for t, path in index)
+
+def test_symlink_cycle(tmpdir):
+    root = make_mirror(tmpdir)
+    os.symlink(root, os.path.join(root, '2018.09', 'loop'))
+    index = RVCatalogue.indexLocalData(root)
+    assert len(index) == len(FILES)